@@ -1,14 +1,58 @@
 import os
+import re
 import json
-import base64
 import asyncio
-from typing import List, Dict, Any, Optional
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
 from datetime import datetime, timedelta
 import random
+import orjson
+import diskcache
 import google.generativeai as genai
 from google.oauth2 import service_account
 from models import ContentPlan, ContentPost, HighlightClip
 
+# Matches JSON content wrapped in a markdown code block
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+
+def _parse_json_response(text: str) -> Dict[str, Any]:
+    """
+    Parse a JSON object from a Gemini response.
+    
+    The JSON may be wrapped in a markdown code block or returned as-is.
+    Raises json.JSONDecodeError (orjson's error subclasses it) if the
+    content is not valid JSON.
+    """
+    match = _FENCE.search(text)
+    payload = match.group(1) if match else text
+    return orjson.loads(payload.strip())
+
+def _parse_json_object(text: str) -> Dict[str, Any]:
+    """Parse a JSON object from a Gemini response, raising ValueError for anything else."""
+    parsed = _parse_json_response(text)
+    if not isinstance(parsed, dict):
+        raise ValueError("Expected a JSON object")
+    return parsed
+
+# Gemini responses are cached on disk, keyed by a hash of the request
+GEMINI_CACHE_DIR = ".gemini_cache"
+GEMINI_CACHE_SIZE_LIMIT = 1 << 30
+
+def _cache_key(contents: Any) -> str:
+    """Hash a generate_content request (prompt text and inline image bytes)."""
+    key = hashlib.blake2b(digest_size=16)
+    parts = contents if isinstance(contents, list) else [contents]
+    for part in parts:
+        if isinstance(part, dict):
+            key.update(part["mime_type"].encode())
+            key.update(part["data"])
+        else:
+            key.update(part.encode())
+        key.update(b"\0")
+    return key.hexdigest()
+
 class GeminiAIAnalyzer:
     def __init__(self, api_key: Optional[str] = None):
         """Initialize the Gemini AI Analyzer with Google API credentials."""
@@ -28,8 +72,66 @@ class GeminiAIAnalyzer:
         else:
             # Configure the Gemini AI client with API key
             genai.configure(api_key=self.api_key)
+        
+        # Shared model and worker threads, reused across all requests
+        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self._executor = ThreadPoolExecutor(max_workers=8)
+        
+        # On-disk cache of Gemini responses
+        if os.environ.get("GEMINI_NO_CACHE"):
+            self._cache = None
+        else:
+            self._cache = diskcache.Cache(GEMINI_CACHE_DIR, size_limit=GEMINI_CACHE_SIZE_LIMIT)
+    
+    def _generate_text_cached(
+        self,
+        contents: Any,
+        validate: Optional[Callable[[str], Any]] = None
+    ) -> str:
+        """
+        Call Gemini and return the response text, memoized on disk.
+        
+        The cache key covers the prompt text and any inline image bytes, so
+        identical requests (retries, re-runs during development) skip the
+        network round-trip. Set GEMINI_NO_CACHE=1 to disable the cache.
+        
+        Args:
+            contents: Prompt text, or a list of prompt text and inline images
+            validate: Parser the caller will apply to the text; responses it
+                raises ValueError for are returned but not cached, so a
+                malformed reply is retried on the next call
+        """
+        key = None
+        if self._cache is not None:
+            key = _cache_key(contents)
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+        
+        text = self.model.generate_content(contents).text
+        
+        if self._cache is not None:
+            try:
+                if validate is not None:
+                    validate(text)
+            except ValueError:
+                return text
+            self._cache.set(key, text)
+        return text
+    
+    async def _generate_text(
+        self,
+        contents: Any,
+        validate: Optional[Callable[[str], Any]] = None
+    ) -> str:
+        """Run a blocking Gemini generate_content call on the executor and return its text."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(self._generate_text_cached, contents, validate)
+        )
     
-    async def analyze_video(self, video_path: str) -> Dict[str, Any]:
+    async def analyze_video(self, frame_jpegs: List[bytes], duration: float) -> Dict[str, Any]:
         """
         Analyze a video to detect highlights using Gemini AI.
         
@@ -39,36 +141,12 @@ class GeminiAIAnalyzer:
         3. Send both to Gemini AI for multimodal analysis
         
         Args:
-            video_path: Path to the video file
+            frame_jpegs: Sample frames from the video as JPEG bytes (see VideoProcessor.sample_frames)
+            duration: Duration of the video in seconds
             
         Returns:
             Dict with analysis results including highlighted moments
         """
-        # Extract a few frames and audio for demo purposes
-        # In a real implementation, you'd process the entire video
-        
-        from moviepy.editor import VideoFileClip
-        import numpy as np
-        from PIL import Image
-        import io
-        
-        # Load video
-        video = VideoFileClip(video_path)
-        duration = video.duration
-        
-        # Extract frames at regular intervals (just for demo)
-        frame_times = [duration * i / 5 for i in range(1, 5)]
-        frames = [video.get_frame(t) for t in frame_times]
-        
-        # Convert frames to base64 for API
-        frame_bases64 = []
-        for frame in frames:
-            img = Image.fromarray(np.uint8(frame))
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG")
-            img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            frame_bases64.append(img_str)
-        
         # Extract audio and convert to text (simplified)
         # In reality, you would use a speech-to-text service
         audio_text = "This is placeholder text for speech-to-text conversion."
@@ -96,30 +174,17 @@ class GeminiAIAnalyzer:
         - engagement_reason (string)
         """
         
-        # Initialize Gemini model - using gemini-pro-vision for multimodal capabilities
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
         # Prepare multimodal content with both text and images
         # This would be properly implemented in a production system
         # For now, we'll use a simplified approach
-        response = await asyncio.to_thread(
-            model.generate_content,
-            [prompt, *[{"mime_type": "image/jpeg", "data": img} for img in frame_bases64[:2]]]  # Only send a couple frames as example
+        response_text = await self._generate_text(
+            [prompt, *[{"mime_type": "image/jpeg", "data": jpeg} for jpeg in frame_jpegs[:2]]],  # Only send a couple frames as example
+            validate=_parse_json_response
         )
         
         try:
             # Try to parse the response as JSON
-            response_text = response.text
-            # Find JSON content if wrapped in markdown code blocks
-            if "```json" in response_text:
-                json_content = response_text.split("```json")[1].split("```")[0].strip()
-                return json.loads(json_content)
-            elif "```" in response_text:
-                json_content = response_text.split("```")[1].split("```")[0].strip()
-                return json.loads(json_content)
-            else:
-                # Try to parse the whole response as JSON
-                return json.loads(response_text)
+            return _parse_json_response(response_text)
         except (json.JSONDecodeError, IndexError):
             # If parsing fails, create a mock response with simulated highlights
             # This is just for demo purposes
@@ -143,7 +208,7 @@ class GeminiAIAnalyzer:
             
             return {"highlighted_moments": mock_highlights}
     
-    async def generate_subtitles(self, clip_path: str) -> str:
+    async def generate_subtitles(self, duration: float) -> str:
         """
         Generate subtitles for a video clip using Gemini AI.
         
@@ -152,24 +217,14 @@ class GeminiAIAnalyzer:
         2. Format the text as subtitles with proper timing
         
         Args:
-            clip_path: Path to the video clip
+            duration: Duration of the clip in seconds
             
         Returns:
             Subtitles in WebVTT format
         """
-        # Extract audio from the clip
-        from moviepy.editor import VideoFileClip
-        
-        # Load clip
-        clip = VideoFileClip(clip_path)
-        duration = clip.duration
-        
         # In a real implementation, you would extract audio and convert to text
         # For demo purposes, we'll create mock subtitles
         
-        # Initialize Gemini model - text-only is fine for this use case
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
         prompt = f"""
         You are a subtitle generation AI. Create realistic subtitles for a video clip that is {duration} seconds long.
         The clip is likely a highlight from a longer video. Create subtitles that would make sense for such a clip.
@@ -188,13 +243,10 @@ class GeminiAIAnalyzer:
         Only respond with the WebVTT content, nothing else.
         """
         
-        response = await asyncio.to_thread(
-            model.generate_content,
-            prompt
-        )
+        response_text = await self._generate_text(prompt)
         
         # Extract the WebVTT content
-        subtitles = response.text
+        subtitles = response_text
         
         # Clean up the response if needed
         if "```" in subtitles:
@@ -205,6 +257,70 @@ class GeminiAIAnalyzer:
         
         return subtitles
     
+    async def generate_subtitles_batch(self, durations: List[float]) -> List[str]:
+        """
+        Generate subtitles for several video clips with a single Gemini request.
+        
+        Args:
+            durations: Duration of each clip in seconds
+            
+        Returns:
+            Subtitles in WebVTT format, one per clip in the same order
+        """
+        if not durations:
+            return []
+        
+        clips_text = "\n".join(
+            f"        Clip {i+1}: {duration} seconds" for i, duration in enumerate(durations)
+        )
+        
+        prompt = f"""
+        You are a subtitle generation AI. Create realistic subtitles for each of the following video clips.
+        The clips are likely highlights from a longer video. Create subtitles that would make sense for such clips.
+        
+{clips_text}
+        
+        Format the subtitles of each clip as WebVTT, with appropriate timestamps. For example:
+        
+        WEBVTT
+        
+        00:00:00.000 --> 00:00:02.500
+        Hello, welcome to this video!
+        
+        Make sure to cover the entire duration of each clip.
+        Format your response as a JSON object mapping each clip number (as a string, e.g. "1")
+        to its WebVTT content. Only provide the JSON object, no additional text.
+        """
+        
+        response_text = await self._generate_text(prompt, validate=_parse_json_object)
+        
+        try:
+            parsed_subtitles = _parse_json_response(response_text)
+        except ValueError:
+            parsed_subtitles = {}
+        
+        if not isinstance(parsed_subtitles, dict):
+            parsed_subtitles = {}
+        
+        subtitles = []
+        missing = []
+        for i in range(len(durations)):
+            clip_subtitles = parsed_subtitles.get(str(i + 1))
+            
+            if not isinstance(clip_subtitles, str):
+                missing.append(i)
+            elif not clip_subtitles.startswith("WEBVTT"):
+                clip_subtitles = "WEBVTT\n\n" + clip_subtitles
+            
+            subtitles.append(clip_subtitles)
+        
+        # Fall back to dedicated requests, run concurrently, for clips missing from the batch
+        fallbacks = await asyncio.gather(*[self.generate_subtitles(durations[i]) for i in missing])
+        for i, clip_subtitles in zip(missing, fallbacks):
+            subtitles[i] = clip_subtitles
+        
+        return subtitles
+    
     async def generate_content_plan(self, highlights: List[HighlightClip]) -> ContentPlan:
         """
         Generate a content plan for posting the highlights on social media.
@@ -218,24 +334,24 @@ class GeminiAIAnalyzer:
         if not highlights:
             raise ValueError("No highlights provided for content plan generation")
         
-        # Initialize Gemini model - text-only is sufficient for content planning
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        # Read the clock once for the prompt and all posts in the plan. The
+        # date is part of the prompt, so cached plans are only reused the same day
+        now = datetime.now()
+        generated_date = now.isoformat()
         
         # Prepare highlight information for the prompt
-        highlights_info = []
-        for i, highlight in enumerate(highlights):
-            highlights_info.append(f"""
-            Highlight {i+1}:
-            - Title: {highlight.title}
-            - Description: {highlight.description}
-            - Duration: {highlight.end_time - highlight.start_time:.2f} seconds
-            """)
-        
-        highlights_text = "\n".join(highlights_info)
+        highlights_text = "\n".join(
+            f"Highlight {i+1}:\n"
+            f"- Title: {highlight.title}\n"
+            f"- Description: {highlight.description}\n"
+            f"- Duration: {highlight.end_time - highlight.start_time:.2f} seconds"
+            for i, highlight in enumerate(highlights)
+        )
         
         prompt = f"""
         You are a social media content planner. Create a posting schedule and captions for the following video highlights.
         These highlights will be posted across different social media platforms.
+        Today's date is {now.strftime("%Y-%m-%d")}.
         
         {highlights_text}
         
@@ -257,31 +373,17 @@ class GeminiAIAnalyzer:
         Only provide the JSON object, no additional text.
         """
         
-        response = await asyncio.to_thread(
-            model.generate_content,
-            prompt
-        )
+        response_text = await self._generate_text(prompt, validate=_parse_json_object)
         
         try:
             # Try to parse the response as JSON
-            response_text = response.text
-            
-            # Find JSON content if wrapped in markdown code blocks
-            if "```json" in response_text:
-                json_content = response_text.split("```json")[1].split("```")[0].strip()
-                parsed_plan = json.loads(json_content)
-            elif "```" in response_text:
-                json_content = response_text.split("```")[1].split("```")[0].strip()
-                parsed_plan = json.loads(json_content)
-            else:
-                # Try to parse the whole response as JSON
-                parsed_plan = json.loads(response_text)
+            parsed_plan = _parse_json_response(response_text)
             
             # Create ContentPlan object
             content_plan = ContentPlan(
                 video_id=highlights[0].video_id,
                 title=f"Content Plan for {len(highlights)} Highlights",
-                generated_date=datetime.now().isoformat(),
+                generated_date=generated_date,
                 posts=[]
             )
             
@@ -302,7 +404,7 @@ class GeminiAIAnalyzer:
                     caption=item.get("caption", "Check out this highlight!"),
                     platform=item.get("platform", "Instagram"),
                     suggested_posting_date=item.get("suggested_posting_date", 
-                                                  (datetime.now() + timedelta(days=i+1)).strftime("%Y-%m-%d")),
+                                                  (now + timedelta(days=i+1)).strftime("%Y-%m-%d")),
                     hashtags=item.get("hashtags", ["video", "highlights", "content"])
                 )
                 
@@ -315,7 +417,7 @@ class GeminiAIAnalyzer:
             content_plan = ContentPlan(
                 video_id=highlights[0].video_id,
                 title=f"Content Plan for {len(highlights)} Highlights",
-                generated_date=datetime.now().isoformat(),
+                generated_date=generated_date,
                 posts=[]
             )
             
@@ -326,7 +428,7 @@ class GeminiAIAnalyzer:
                     title=f"Highlight {i+1}: {highlight.title}",
                     caption=f"Check out this amazing highlight from our video! {highlight.description}",
                     platform="Instagram" if i % 2 == 0 else "YouTube",
-                    suggested_posting_date=(datetime.now() + timedelta(days=i+1)).strftime("%Y-%m-%d"),
+                    suggested_posting_date=(now + timedelta(days=i+1)).strftime("%Y-%m-%d"),
                     hashtags=["video", "highlights", "content", f"part{i+1}"]
                 )
                 
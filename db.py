@@ -0,0 +1,204 @@
+import sqlite3
+import threading
+from typing import List, Optional
+from cachetools import LRUCache
+from models import VideoMetadata, HighlightClip, ContentPlan, ProcessingStatus
+
+DB_PATH = "state.db"
+
+# Hot-path caches in front of SQLite; bounded so memory stays flat under load
+VIDEO_CACHE_SIZE = 512
+STATUS_CACHE_SIZE = 1024
+
+# Opened by init() rather than at import, so processes that merely import
+# this module (e.g. spawned pool workers re-running main) don't open it
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+_video_cache: LRUCache = LRUCache(maxsize=VIDEO_CACHE_SIZE)
+_status_cache: LRUCache = LRUCache(maxsize=STATUS_CACHE_SIZE)
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS videos (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS video_hashes (
+        content_hash TEXT PRIMARY KEY,
+        video_id TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS highlights (
+        id TEXT PRIMARY KEY,
+        video_id TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_highlights_video_id ON highlights (video_id);
+    CREATE TABLE IF NOT EXISTS content_plans (
+        video_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS status (
+        video_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+"""
+
+def init() -> None:
+    """Open the database and create the tables, if not done yet."""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            return
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        with conn:
+            conn.executescript(_SCHEMA)
+        _conn = conn
+
+def _execute(sql: str, params: tuple = ()) -> None:
+    init()
+    with _lock, _conn:
+        _conn.execute(sql, params)
+
+def _fetchall(sql: str, params: tuple = ()) -> List[tuple]:
+    init()
+    with _lock:
+        return _conn.execute(sql, params).fetchall()
+
+# Videos
+
+def save_video(video: VideoMetadata) -> None:
+    """Insert or update a video's metadata."""
+    # ON CONFLICT keeps the original rowid, so listing order stays upload order
+    _execute(
+        "INSERT INTO videos (id, data) VALUES (?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+        (video.id, video.model_dump_json())
+    )
+    _video_cache[video.id] = video
+
+def get_video(video_id: str) -> Optional[VideoMetadata]:
+    """Get a video's metadata, or None if it doesn't exist."""
+    video = _video_cache.get(video_id)
+    if video is not None:
+        return video
+
+    rows = _fetchall("SELECT data FROM videos WHERE id = ?", (video_id,))
+    if not rows:
+        return None
+
+    video = VideoMetadata.model_validate_json(rows[0][0])
+    _video_cache[video_id] = video
+    return video
+
+def list_videos() -> List[VideoMetadata]:
+    """Get all videos in upload order."""
+    rows = _fetchall("SELECT data FROM videos ORDER BY rowid")
+    return [VideoMetadata.model_validate_json(data) for (data,) in rows]
+
+def delete_video(video_id: str) -> None:
+    """Delete a video's metadata."""
+    _execute("DELETE FROM videos WHERE id = ?", (video_id,))
+    _video_cache.pop(video_id, None)
+
+def save_video_hash(content_hash: str, video_id: str) -> None:
+    """Map an uploaded file's content hash to its video."""
+    _execute(
+        "INSERT INTO video_hashes (content_hash, video_id) VALUES (?, ?) "
+        "ON CONFLICT(content_hash) DO UPDATE SET video_id = excluded.video_id",
+        (content_hash, video_id)
+    )
+
+def get_video_id_by_hash(content_hash: str) -> Optional[str]:
+    """Get the video uploaded with the given content hash, or None."""
+    rows = _fetchall("SELECT video_id FROM video_hashes WHERE content_hash = ?", (content_hash,))
+    if not rows:
+        return None
+    return rows[0][0]
+
+def delete_video_hash(content_hash: str, video_id: str) -> None:
+    """Remove a content hash mapping if it still points to the given video."""
+    _execute(
+        "DELETE FROM video_hashes WHERE content_hash = ? AND video_id = ?",
+        (content_hash, video_id)
+    )
+
+# Highlights
+
+def save_highlight(highlight: HighlightClip) -> None:
+    """Insert or update a highlight clip."""
+    _execute(
+        "INSERT INTO highlights (id, video_id, data) VALUES (?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+        (highlight.id, highlight.video_id, highlight.model_dump_json())
+    )
+
+def get_highlight(highlight_id: str) -> Optional[HighlightClip]:
+    """Get a highlight clip, or None if it doesn't exist."""
+    rows = _fetchall("SELECT data FROM highlights WHERE id = ?", (highlight_id,))
+    if not rows:
+        return None
+    return HighlightClip.model_validate_json(rows[0][0])
+
+def get_highlights(video_id: str) -> List[HighlightClip]:
+    """Get all highlight clips of a video."""
+    rows = _fetchall(
+        "SELECT data FROM highlights WHERE video_id = ? ORDER BY rowid",
+        (video_id,)
+    )
+    return [HighlightClip.model_validate_json(data) for (data,) in rows]
+
+def delete_highlights(video_id: str) -> None:
+    """Delete all highlight clips of a video."""
+    _execute("DELETE FROM highlights WHERE video_id = ?", (video_id,))
+
+# Content plans
+
+def save_content_plan(content_plan: ContentPlan) -> None:
+    """Insert or update the content plan of a video."""
+    _execute(
+        "INSERT INTO content_plans (video_id, data) VALUES (?, ?) "
+        "ON CONFLICT(video_id) DO UPDATE SET data = excluded.data",
+        (content_plan.video_id, content_plan.model_dump_json())
+    )
+
+def get_content_plan(video_id: str) -> Optional[ContentPlan]:
+    """Get the content plan of a video, or None if it doesn't exist."""
+    rows = _fetchall("SELECT data FROM content_plans WHERE video_id = ?", (video_id,))
+    if not rows:
+        return None
+    return ContentPlan.model_validate_json(rows[0][0])
+
+def delete_content_plan(video_id: str) -> None:
+    """Delete the content plan of a video."""
+    _execute("DELETE FROM content_plans WHERE video_id = ?", (video_id,))
+
+# Processing status
+
+def set_status(video_id: str, status: str) -> None:
+    """Set the processing status of a video."""
+    processing_status = ProcessingStatus(video_id=video_id, status=status)
+    _execute(
+        "INSERT INTO status (video_id, data) VALUES (?, ?) "
+        "ON CONFLICT(video_id) DO UPDATE SET data = excluded.data",
+        (video_id, processing_status.model_dump_json())
+    )
+    _status_cache[video_id] = processing_status
+
+def get_status(video_id: str) -> Optional[ProcessingStatus]:
+    """Get the processing status of a video, or None if it doesn't exist."""
+    processing_status = _status_cache.get(video_id)
+    if processing_status is not None:
+        return processing_status
+
+    rows = _fetchall("SELECT data FROM status WHERE video_id = ?", (video_id,))
+    if not rows:
+        return None
+
+    processing_status = ProcessingStatus.model_validate_json(rows[0][0])
+    _status_cache[video_id] = processing_status
+    return processing_status
+
+def delete_status(video_id: str) -> None:
+    """Delete the processing status of a video."""
+    _execute("DELETE FROM status WHERE video_id = ?", (video_id,))
+    _status_cache.pop(video_id, None)
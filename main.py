@@ -1,23 +1,59 @@
 import os
 import uuid
-import shutil
+import hashlib
+import mimetypes
 import asyncio
-from typing import List, Optional
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+import aiofiles
+import orjson
+from typing import List, Optional, Set
 from datetime import datetime
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 
 from pydantic import BaseModel
 from models import VideoMetadata, HighlightClip, ContentPlan, ProcessingStatus
-from video_processor import VideoProcessor
+from video_processor import VideoProcessor, extract_clip, extract_thumbnail
 from ai_analyzer import GeminiAIAnalyzer
+import db
+
+# Worker processes for ffmpeg-heavy clip and thumbnail extraction, and the
+# AI analyzer; both are created by lifespan when the server starts
+CPU_POOL: Optional[ProcessPoolExecutor] = None
+ai_analyzer: Optional[GeminiAIAnalyzer] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Set up server-only state on startup and tear it down on shutdown.
+    
+    This lives here rather than at module level because pool workers are
+    spawned, and with `python main.py` each worker re-imports this module.
+    Workers are spawned rather than forked because the Gemini client's
+    threads and grpc channels aren't safe to fork.
+    """
+    global CPU_POOL, ai_analyzer
+    
+    db.init()
+    ai_analyzer = GeminiAIAnalyzer()
+    CPU_POOL = ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    
+    yield
+    
+    CPU_POOL.shutdown()
 
 app = FastAPI(
     title="Video Highlight Automation API",
     description="API for automatically extracting highlights from videos",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS
@@ -41,126 +77,141 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 app.mount("/clips", StaticFiles(directory="clips"), name="clips")
 app.mount("/thumbnails", StaticFiles(directory="thumbnails"), name="thumbnails")
 
-# In-memory database (replace with a real database in production)
-videos_db = {}
-highlights_db = {}
-content_plans_db = {}
-processing_status_db = {}
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Videos being processed by this server process. A video left in PROCESSING
+# by an earlier run isn't in here, so re-uploading it processes it again.
+_in_flight_video_ids: Set[str] = set()
 
-# Initialize AI analyzer
-ai_analyzer = GeminiAIAnalyzer()
+# Extract clip and thumbnail for a single highlight
+async def _process_one_highlight(
+    video_id: str,
+    file_path: str,
+    i: int,
+    highlight: dict
+) -> HighlightClip:
+    highlight_id = str(uuid.uuid4())
+    
+    clip_filename = f"{video_id}_highlight_{i}.mp4"
+    clip_path = os.path.join("clips", clip_filename)
+    
+    thumbnail_filename = f"{highlight_id}.jpg"
+    thumbnail_path = os.path.join("thumbnails", thumbnail_filename)
+    
+    subtitle_filename = f"{highlight_id}.vtt"
+    subtitle_path = os.path.join("subtitles", subtitle_filename)
+    
+    start_time = highlight.get("start_time", 0)
+    end_time = highlight.get("end_time", 0)
+    thumbnail_time = start_time + ((end_time - start_time) / 2)
+    
+    # Extract clip and thumbnail in worker processes
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        loop.run_in_executor(CPU_POOL, extract_clip, file_path, start_time, end_time, clip_path),
+        loop.run_in_executor(CPU_POOL, extract_thumbnail, file_path, thumbnail_time, thumbnail_path)
+    )
+    
+    return HighlightClip(
+        id=highlight_id,
+        video_id=video_id,
+        title=highlight.get("title", f"Highlight {i+1}"),
+        description=highlight.get("description", ""),
+        start_time=start_time,
+        end_time=end_time,
+        clip_path=clip_path,
+        subtitle_path=subtitle_path,
+        thumbnail_path=thumbnail_path
+    )
 
 # Background task to process videos
 async def process_video(video_id: str, file_path: str):
     try:
         # Update status
-        processing_status_db[video_id] = ProcessingStatus(
-            video_id=video_id,
-            status="PROCESSING"
-        )
+        db.set_status(video_id, "PROCESSING")
         
         # Process video to extract metadata
-        processor = VideoProcessor(file_path)
-        
-        # Update video metadata
-        videos_db[video_id].duration = processor.get_duration()
-        videos_db[video_id].frames = processor.get_frame_count()
-        videos_db[video_id].processing_status = "PROCESSING"
-        
-        # Update status
-        processing_status_db[video_id] = ProcessingStatus(
-            video_id=video_id,
-            status="ANALYZING"
-        )
+        with VideoProcessor(file_path) as processor:
+            # ffprobe can read the whole file when the frame count isn't stored
+            # in the container, so keep it off the event loop
+            loop = asyncio.get_running_loop()
+            duration = await loop.run_in_executor(None, processor.get_duration)
+            frame_count = await loop.run_in_executor(None, processor.get_frame_count)
+            
+            # Update video metadata
+            video = db.get_video(video_id)
+            video.duration = duration
+            video.frames = frame_count
+            video.processing_status = "PROCESSING"
+            db.save_video(video)
+            
+            # Update status
+            db.set_status(video_id, "ANALYZING")
+            
+            frame_jpegs, duration = await processor.sample_frames(4)
         
         # Analyze video with AI
-        analysis_result = await ai_analyzer.analyze_video(file_path)
+        analysis_result = await ai_analyzer.analyze_video(frame_jpegs, duration)
         
         # Extract highlights
-        processing_status_db[video_id] = ProcessingStatus(
-            video_id=video_id,
-            status="EXTRACTING_HIGHLIGHTS"
-        )
+        db.set_status(video_id, "EXTRACTING_HIGHLIGHTS")
         
         highlights = analysis_result.get("highlighted_moments", [])
-        highlight_clips = []
         
-        for i, highlight in enumerate(highlights):
-            highlight_id = str(uuid.uuid4())
-            
-            # Extract clip
-            clip_filename = f"{video_id}_highlight_{i}.mp4"
-            clip_path = os.path.join("clips", clip_filename)
-            
-            start_time = highlight.get("start_time", 0)
-            end_time = highlight.get("end_time", 0)
-            
-            processor.extract_clip(start_time, end_time, clip_path)
-            
-            # Extract thumbnail
-            thumbnail_filename = f"{highlight_id}.jpg"
-            thumbnail_path = os.path.join("thumbnails", thumbnail_filename)
-            
-            thumbnail_time = start_time + ((end_time - start_time) / 2)
-            processor.extract_thumbnail(thumbnail_time, thumbnail_path)
-            
-            # Generate subtitles
-            subtitle_filename = f"{highlight_id}.vtt"
-            subtitle_path = os.path.join("subtitles", subtitle_filename)
-            
-            subtitles = await ai_analyzer.generate_subtitles(clip_path)
-            
-            with open(subtitle_path, "w") as f:
-                f.write(subtitles)
-            
-            # Create highlight object
-            highlight_clip = HighlightClip(
-                id=highlight_id,
-                video_id=video_id,
-                title=highlight.get("title", f"Highlight {i+1}"),
-                description=highlight.get("description", ""),
-                start_time=start_time,
-                end_time=end_time,
-                clip_path=clip_path,
-                subtitle_path=subtitle_path,
-                thumbnail_path=thumbnail_path
-            )
+        # Highlights are extracted concurrently, while subtitles for all of
+        # them are generated with a single Gemini request
+        durations = [
+            highlight.get("end_time", 0) - highlight.get("start_time", 0)
+            for highlight in highlights
+        ]
+        highlight_clips, subtitles = await asyncio.gather(
+            asyncio.gather(*[
+                _process_one_highlight(video_id, file_path, i, highlight)
+                for i, highlight in enumerate(highlights)
+            ]),
+            ai_analyzer.generate_subtitles_batch(durations)
+        )
+        
+        for highlight_clip, clip_subtitles in zip(highlight_clips, subtitles):
+            async with aiofiles.open(highlight_clip.subtitle_path, "w") as f:
+                await f.write(clip_subtitles)
             
-            highlight_clips.append(highlight_clip)
-            highlights_db[highlight_id] = highlight_clip
+            db.save_highlight(highlight_clip)
         
         # Generate content plan
-        processing_status_db[video_id] = ProcessingStatus(
-            video_id=video_id,
-            status="GENERATING_CONTENT_PLAN"
-        )
+        db.set_status(video_id, "GENERATING_CONTENT_PLAN")
         
         content_plan = await ai_analyzer.generate_content_plan(highlight_clips)
-        content_plans_db[video_id] = content_plan
+        db.save_content_plan(content_plan)
         
         # Save content plan to file
         content_plan_filename = f"{video_id}_content_plan.json"
         content_plan_path = os.path.join("content_plans", content_plan_filename)
         
-        videos_db[video_id].content_plan_path = content_plan_path
-        videos_db[video_id].highlights_count = len(highlight_clips)
-        videos_db[video_id].processing_status = "COMPLETED"
+        async with aiofiles.open(content_plan_path, "wb") as f:
+            await f.write(orjson.dumps(content_plan.model_dump()))
+        
+        video = db.get_video(video_id)
+        video.content_plan_path = content_plan_path
+        video.highlights_count = len(highlight_clips)
+        video.processing_status = "COMPLETED"
+        db.save_video(video)
         
         # Update status
-        processing_status_db[video_id] = ProcessingStatus(
-            video_id=video_id,
-            status="COMPLETED"
-        )
+        db.set_status(video_id, "COMPLETED")
         
     except Exception as e:
         print(f"Error processing video {video_id}: {str(e)}")
-        videos_db[video_id].processing_status = "ERROR"
-        videos_db[video_id].error_message = str(e)
+        video = db.get_video(video_id)
+        if video is not None:
+            video.processing_status = "ERROR"
+            video.error_message = str(e)
+            db.save_video(video)
         
-        processing_status_db[video_id] = ProcessingStatus(
-            video_id=video_id,
-            status="ERROR"
-        )
+        db.set_status(video_id, "ERROR")
+    finally:
+        _in_flight_video_ids.discard(video_id)
 
 @app.post("/api/upload", response_model=VideoMetadata)
 async def upload_video(
@@ -177,14 +228,35 @@ async def upload_video(
     # Generate unique ID for the video
     video_id = str(uuid.uuid4())
     
-    # Create upload directory if it doesn't exist
-    os.makedirs("uploads", exist_ok=True)
-    
     # Save the uploaded file
     file_path = os.path.join("uploads", f"{video_id}_{file.filename}")
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stream to disk in chunks so large uploads don't block the event loop,
+    # hashing the content on the way to detect re-uploads
+    content_hash = hashlib.blake2b(digest_size=16)
+    async with aiofiles.open(file_path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            content_hash.update(chunk)
+            await buffer.write(chunk)
+    
+    digest = content_hash.hexdigest()
+    
+    # Reuse the existing results if the same video was uploaded before and
+    # either finished processing or is still being processed by this server
+    existing_video_id = db.get_video_id_by_hash(digest)
+    if existing_video_id is not None:
+        existing_video = db.get_video(existing_video_id)
+        if existing_video is not None and (
+            existing_video.processing_status == "COMPLETED"
+            or existing_video_id in _in_flight_video_ids
+        ):
+            os.remove(file_path)
+            
+            # Keep the title and description of the latest upload
+            existing_video.title = title
+            existing_video.description = description
+            db.save_video(existing_video)
+            return existing_video
     
     # Create video metadata
     video_metadata = VideoMetadata(
@@ -200,66 +272,71 @@ async def upload_video(
         duration=None,
         frames=None,
         highlights_count=None,
-        content_plan_path=None
+        content_plan_path=None,
+        content_hash=digest
     )
     
     # Save to database
-    videos_db[video_id] = video_metadata
+    db.save_video(video_metadata)
+    db.save_video_hash(digest, video_id)
     
     # Start processing in background
+    _in_flight_video_ids.add(video_id)
     background_tasks.add_task(process_video, video_id, file_path)
     
     return video_metadata
 
 @app.get("/api/status/{video_id}", response_model=ProcessingStatus)
 async def get_processing_status(video_id: str):
-    if video_id not in processing_status_db:
+    processing_status = db.get_status(video_id)
+    if processing_status is None:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    return processing_status_db[video_id]
+    return processing_status
 
 @app.get("/api/videos/{video_id}", response_model=VideoMetadata)
 async def get_video(video_id: str):
-    if video_id not in videos_db:
+    video = db.get_video(video_id)
+    if video is None:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    return videos_db[video_id]
+    return video
 
 @app.get("/api/videos", response_model=List[VideoMetadata])
 async def get_videos():
-    return list(videos_db.values())
+    return db.list_videos()
 
 @app.get("/api/videos/{video_id}/highlights", response_model=List[HighlightClip])
 async def get_highlights(video_id: str):
-    if video_id not in videos_db:
+    if db.get_video(video_id) is None:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    return [h for h in highlights_db.values() if h.video_id == video_id]
+    return db.get_highlights(video_id)
 
 @app.get("/api/videos/{video_id}/content_plan", response_model=ContentPlan)
 async def get_content_plan(video_id: str):
-    if video_id not in videos_db:
+    if db.get_video(video_id) is None:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    if video_id not in content_plans_db:
+    content_plan = db.get_content_plan(video_id)
+    if content_plan is None:
         raise HTTPException(status_code=404, detail="Content plan not found")
     
-    return content_plans_db[video_id]
+    return content_plan
 
 @app.delete("/api/videos/{video_id}")
 async def delete_video(video_id: str):
-    if video_id not in videos_db:
-        raise HTTPException(status_code=404, detail="Video not found")
-    
     # Get video data
-    video = videos_db[video_id]
+    video = db.get_video(video_id)
+    if video is None:
+        raise HTTPException(status_code=404, detail="Video not found")
     
     # Delete the video file
     if os.path.exists(video.upload_path):
         os.remove(video.upload_path)
     
     # Delete highlights
-    highlights = [h for h in highlights_db.values() if h.video_id == video_id]
+    highlights = db.get_highlights(video_id)
     
     for highlight in highlights:
         # Delete clip
@@ -273,27 +350,100 @@ async def delete_video(video_id: str):
         # Delete subtitle
         if highlight.subtitle_path and os.path.exists(highlight.subtitle_path):
             os.remove(highlight.subtitle_path)
-        
-        # Remove from database
-        if highlight.id in highlights_db:
-            del highlights_db[highlight.id]
+    
+    # Remove highlights from database
+    db.delete_highlights(video_id)
     
     # Delete content plan
-    if video_id in content_plans_db:
-        del content_plans_db[video_id]
+    db.delete_content_plan(video_id)
     
     # Delete from database
-    del videos_db[video_id]
-    
-    if video_id in processing_status_db:
-        del processing_status_db[video_id]
+    db.delete_video(video_id)
+    if video.content_hash:
+        db.delete_video_hash(video.content_hash, video_id)
+    db.delete_status(video_id)
     
     return {"message": "Video deleted successfully"}
 
+# Streaming endpoints for media files. FileResponse lets the server use
+# sendfile where available, and Range requests are served as partial
+# content so browsers can seek within videos.
+STREAM_CHUNK_SIZE = 1 << 20
+STREAM_HEADERS = {"Accept-Ranges": "bytes", "Cache-Control": "public, max-age=3600"}
+
+async def _iter_file_range(path: str, start: int, end: int):
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _stream_file(directory: str, name: str, media_type: str, request: Request):
+    # Only serve plain file names from the given directory
+    if os.path.basename(name) != name or name in ("", ".", ".."):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    path = os.path.join(directory, name)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    range_header = request.headers.get("range")
+    if not range_header:
+        return FileResponse(path, media_type=media_type, headers=STREAM_HEADERS)
+    
+    # Parse a single "bytes=start-end" range, "end" or "start" may be omitted
+    file_size = os.path.getsize(path)
+    try:
+        unit, byte_range = range_header.split("=", 1)
+        start_text, end_text = byte_range.split(",")[0].strip().split("-", 1)
+        if unit.strip() != "bytes":
+            raise ValueError(range_header)
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+        else:
+            start = file_size - int(end_text)
+            end = file_size - 1
+        start = max(start, 0)
+        end = min(end, file_size - 1)
+        if start > end:
+            raise ValueError(range_header)
+    except ValueError:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"}
+        )
+    
+    headers = {
+        **STREAM_HEADERS,
+        "Content-Range": f"bytes {start}-{end}/{file_size}",
+        "Content-Length": str(end - start + 1),
+    }
+    return StreamingResponse(
+        _iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
+
+@app.get("/stream/clips/{name}")
+async def stream_clip(name: str, request: Request):
+    return _stream_file("clips", name, "video/mp4", request)
+
+@app.get("/stream/uploads/{name}")
+async def stream_upload(name: str, request: Request):
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return _stream_file("uploads", name, media_type, request)
+
 # Optional: Endpoints for publishing to social media
 @app.post("/api/publish/youtube/{clip_id}")
 async def publish_to_youtube(clip_id: str):
-    if clip_id not in highlights_db:
+    if db.get_highlight(clip_id) is None:
         raise HTTPException(status_code=404, detail="Highlight clip not found")
     
     # This would integrate with the YouTube API
@@ -302,7 +452,7 @@ async def publish_to_youtube(clip_id: str):
 
 @app.post("/api/publish/instagram/{clip_id}")
 async def publish_to_instagram(clip_id: str):
-    if clip_id not in highlights_db:
+    if db.get_highlight(clip_id) is None:
         raise HTTPException(status_code=404, detail="Highlight clip not found")
     
     # This would integrate with the Instagram API
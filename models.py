@@ -16,6 +16,7 @@ class VideoMetadata(BaseModel):
     frames: Optional[int] = None
     highlights_count: Optional[int] = None
     content_plan_path: Optional[str] = None
+    content_hash: Optional[str] = None  # BLAKE2b digest of the uploaded file
 
 class HighlightClip(BaseModel):
     id: str
@@ -1,7 +1,662 @@
 import os
+import json
+import hashlib
+import asyncio
+import functools
+import tempfile
 import subprocess
-from typing import Optional
-from moviepy.editor import VideoFileClip
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Set, Tuple
+
+# Optional in-process demuxer/decoder, used to keep one container open
+# across several frame reads on the same video
+try:
+    import av
+except ImportError:
+    av = None
+
+# Optional GPU decoders for in-memory frame access. They are imported on first
+# use: torchcodec pulls in torch, which pool workers shouldn't pay for, and it
+# raises RuntimeError rather than ImportError when its FFmpeg libraries fail to load
+@functools.lru_cache(maxsize=None)
+def _load_torchcodec_decoder() -> Any:
+    """Get torchcodec's VideoDecoder class, or None if it can't be loaded."""
+    try:
+        from torchcodec.decoders import VideoDecoder
+    except (ImportError, RuntimeError, OSError):
+        return None
+    return VideoDecoder
+
+@functools.lru_cache(maxsize=None)
+def _load_decord() -> Any:
+    """Get the decord module, or None if it can't be loaded."""
+    try:
+        import decord
+    except (ImportError, RuntimeError, OSError):
+        return None
+    return decord
+
+# Sampled frames are downscaled to fit this size and JPEG-compressed
+# with this ffmpeg quality scale (2-31, lower is better)
+SAMPLE_FRAME_MAX_SIDE = 512
+SAMPLE_FRAME_QSCALE = 5
+
+# JPEG quality scale for saved thumbnails, for both ffmpeg and PyAV
+THUMBNAIL_QSCALE = 2
+
+async def _sample_frame_ffmpeg(video_path: str, time: float) -> Optional[bytes]:
+    """
+    Decode a single frame with ffmpeg and return it as JPEG bytes.
+    
+    Putting -ss before -i makes ffmpeg seek at the demuxer level to the
+    nearest keyframe, so only a few frames are decoded regardless of the
+    position in the video.
+    """
+    scale = (
+        f"scale='min({SAMPLE_FRAME_MAX_SIDE},iw)':'min({SAMPLE_FRAME_MAX_SIDE},ih)'"
+        ":force_original_aspect_ratio=decrease"
+    )
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-v', 'error',
+        '-ss', str(time),
+        '-i', video_path,
+        '-frames:v', '1',
+        '-vf', scale,
+        '-q:v', str(SAMPLE_FRAME_QSCALE),
+        '-c:v', 'mjpeg',
+        '-f', 'image2pipe',
+        '-',
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await process.communicate()
+    
+    if process.returncode != 0 or not stdout:
+        return None
+    return stdout
+
+async def _sample_frames_ffmpeg(video_path: str, times: List[float]) -> List[bytes]:
+    """
+    Sample frames at the given times, running one ffmpeg process per frame concurrently.
+    
+    Args:
+        video_path: Path to the video file
+        times: Times in seconds
+        
+    Returns:
+        JPEG images as raw bytes; frames that could not be decoded are skipped
+    """
+    frames = await asyncio.gather(*[_sample_frame_ffmpeg(video_path, t) for t in times])
+    return [frame for frame in frames if frame is not None]
+
+def _write_jpeg(frame: Any, output_path: str) -> None:
+    """Encode a decoded PyAV frame as a JPEG file at THUMBNAIL_QSCALE."""
+    frame = frame.reformat(format='yuvj420p')
+    frame.pts = None
+    
+    with av.open(output_path, 'w', format='image2') as output:
+        stream = output.add_stream('mjpeg')
+        stream.width = frame.width
+        stream.height = frame.height
+        stream.pix_fmt = 'yuvj420p'
+        # Constant quality like ffmpeg's -q:v; the default is a fixed low bitrate
+        stream.codec_context.qmin = THUMBNAIL_QSCALE
+        stream.codec_context.qmax = THUMBNAIL_QSCALE
+        for packet in stream.encode(frame):
+            output.mux(packet)
+        for packet in stream.encode():
+            output.mux(packet)
+
+# Output directories already created by this process
+_MKDIR_CACHE: Set[str] = set()
+
+def _ensure_dir(path: str) -> None:
+    """Create a directory if needed, skipping the filesystem check after the first call."""
+    if not path or path in _MKDIR_CACHE:
+        return
+    os.makedirs(path, exist_ok=True)
+    _MKDIR_CACHE.add(path)
+
+def _run_ffmpeg(args: List[str]) -> None:
+    """Run ffmpeg with the given arguments, overwriting outputs and raising on failure."""
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', *args], check=True)
+
+@functools.lru_cache(maxsize=None)
+def _nvenc_available() -> bool:
+    """
+    Check once per process whether h264_nvenc actually works on this host.
+    
+    Many ffmpeg builds list h264_nvenc even without an NVIDIA GPU or driver,
+    so this encodes a single blank frame rather than checking -encoders.
+    """
+    try:
+        subprocess.run(
+            [
+                'ffmpeg', '-v', 'error',
+                '-f', 'lavfi', '-i', 'nullsrc=s=256x256',
+                '-frames:v', '1',
+                '-c:v', 'h264_nvenc',
+                '-f', 'null', '-'
+            ],
+            capture_output=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+# ffprobe output is cached on disk per file version and shared between processes
+PROBE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "vp_probe_cache")
+
+def _probe_cache_path(video_path: str) -> str:
+    """Get the probe cache file for a video, keyed by real path, size and mtime."""
+    stat = os.stat(video_path)
+    key = f"{os.path.realpath(video_path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(PROBE_CACHE_DIR, f"{digest}.json")
+
+def _ffprobe(video_path: str) -> Dict[str, Any]:
+    """Read container and stream metadata with ffprobe, or from the probe cache."""
+    cache_path = _probe_cache_path(video_path)
+    try:
+        with open(cache_path, 'rb') as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        pass
+    
+    result = subprocess.run(
+        [
+            'ffprobe', '-v', 'error',
+            '-print_format', 'json',
+            '-show_format', '-show_streams',
+            video_path
+        ],
+        capture_output=True, check=True
+    )
+    probe = json.loads(result.stdout)
+    
+    # Write to a temporary file and rename it, so readers never see a partial entry
+    try:
+        _ensure_dir(PROBE_CACHE_DIR)
+        fd, temp_path = tempfile.mkstemp(dir=PROBE_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(result.stdout)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass
+    
+    return probe
+
+def _video_stream(probe: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the first video stream from ffprobe output."""
+    for stream in probe.get('streams', []):
+        if stream.get('codec_type') == 'video':
+            return stream
+    return {}
+
+def _parse_rate(rate: str) -> float:
+    """Parse an ffprobe frame rate such as '30000/1001'."""
+    numerator, _, denominator = rate.partition('/')
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+def _video_codec(video_path: str) -> Optional[str]:
+    """Get the codec name of the first video stream."""
+    try:
+        return _video_stream(_ffprobe(video_path)).get('codec_name')
+    except subprocess.CalledProcessError:
+        return None
+
+# CPU encoder settings for re-encoded clips, from fastest to smallest output
+CLIP_QUALITY_ARGS = {
+    'speed': ['-c:v', 'libx264', '-preset', 'ultrafast'],
+    'balanced': ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23'],
+    'quality': ['-c:v', 'libsvtav1', '-preset', '8', '-crf', '35'],
+}
+
+@functools.lru_cache(maxsize=None)
+def _svtav1_available() -> bool:
+    """Check once per process whether ffmpeg was built with the libsvtav1 encoder."""
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-encoders'],
+            capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return 'libsvtav1' in result.stdout
+
+def _clip_quality_args(quality_mode: str) -> List[str]:
+    """Get the CPU encoder settings for a quality mode, using x264 if SVT-AV1 is missing."""
+    if quality_mode == 'quality' and not _svtav1_available():
+        # Many stock ffmpeg builds (e.g. Ubuntu 22.04) ship without libsvtav1
+        quality_mode = 'balanced'
+    return CLIP_QUALITY_ARGS[quality_mode]
+
+# Low-latency settings for preview clips: short GOP, one reference frame, no B-frames
+PREVIEW_ARGS = [
+    '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+    '-x264-params', 'keyint=30:ref=1:bframes=0', '-g', '30'
+]
+PREVIEW_GPU_ARGS = ['-c:v', 'h264_nvenc', '-preset', 'p1', '-tune', 'll', '-g', '30']
+
+# Sources NVDEC can't decode on every GPU generation (AV1 needs Ampere or newer)
+GPU_DECODE_UNSUPPORTED_CODECS = {'av1'}
+
+# Containers that can hold soft mov_text subtitles
+SOFT_SUBTITLE_EXTENSIONS = {'.mp4', '.m4v', '.mov'}
+
+# Codecs that can be copied into an MP4 as-is. Browsers play H.264 and AAC/MP3
+# everywhere; HEVC (e.g. iPhone MOV uploads) plays in Safari when tagged hvc1
+# and in Chrome/Edge with hardware support, but not in Firefox
+STREAM_COPY_VIDEO_CODECS = {'h264', 'hevc', 'av1'}
+STREAM_COPY_AUDIO_CODECS = {'aac', 'mp3'}
+
+def _can_stream_copy(video_path: str) -> bool:
+    """Check whether a video's streams can be copied into an MP4 without re-encoding."""
+    try:
+        probe = _ffprobe(video_path)
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return False
+    
+    video_codec = _video_stream(probe).get('codec_name')
+    audio_codecs = {
+        stream.get('codec_name')
+        for stream in probe.get('streams', [])
+        if stream.get('codec_type') == 'audio'
+    }
+    return video_codec in STREAM_COPY_VIDEO_CODECS and audio_codecs <= STREAM_COPY_AUDIO_CODECS
+
+def _stream_copy_args(video_path: str) -> List[str]:
+    """Get the ffmpeg arguments for copying a video's streams into an MP4."""
+    if _video_codec(video_path) == 'hevc':
+        # ffmpeg tags copied HEVC as hev1 by default, which Safari won't play
+        return ['-c', 'copy', '-tag:v', 'hvc1']
+    return ['-c', 'copy']
+
+def _run_clip_ffmpeg(
+    video_path: str,
+    start_time: float,
+    end_time: float,
+    output_path: str,
+    codec_args: List[str],
+    input_args: Optional[List[str]] = None
+) -> None:
+    """Cut a clip with ffmpeg using the given codec (and optional input) arguments."""
+    _run_ffmpeg([
+        *(input_args or []),
+        '-ss', str(start_time),
+        '-to', str(end_time),
+        '-i', video_path,
+        *codec_args,
+        # Put the index at the front so playback can start before the download finishes
+        '-movflags', '+faststart',
+        output_path
+    ])
+
+# Clip and thumbnail extraction are module-level functions so they can be
+# pickled and run in a ProcessPoolExecutor. Each call opens its own reader,
+# so calls for the same video can safely run in parallel.
+def extract_clip(
+    video_path: str,
+    start_time: float,
+    end_time: float,
+    output_path: str,
+    accurate: bool = False,
+    use_gpu: bool = False,
+    quality_mode: Literal['speed', 'balanced', 'quality'] = 'balanced',
+    preview: bool = False
+) -> str:
+    """
+    Extract a clip from a video between start_time and end_time.
+    
+    By default the streams are copied without re-encoding, so the clip starts
+    on the keyframe at or before start_time. Sources whose codecs can't be
+    copied into an MP4 (see STREAM_COPY_VIDEO_CODECS and
+    STREAM_COPY_AUDIO_CODECS), or that ffmpeg fails to copy, are re-encoded
+    on the CPU instead.
+    
+    Pass accurate=True to re-encode for a frame-accurate cut, or use_gpu=True
+    to re-encode on the GPU with NVDEC/NVENC. The GPU path falls back to the
+    CPU encoder when h264_nvenc doesn't work on this host, the source codec
+    can't be decoded on the GPU, or the GPU encode fails.
+    
+    CPU re-encodes use the encoder settings selected by quality_mode: 'speed'
+    (x264 ultrafast), 'balanced' (x264 veryfast, CRF 23) or 'quality'
+    (SVT-AV1, ~30% smaller files at similar encode speed; 'balanced' is used
+    instead when ffmpeg was built without libsvtav1).
+    
+    preview=True re-encodes a low-importance preview with the cheapest
+    low-latency settings instead (PREVIEW_ARGS, or NVENC p1 with use_gpu),
+    trading file size for encode CPU.
+    
+    Args:
+        video_path: Path to the source video
+        start_time: Start time in seconds
+        end_time: End time in seconds
+        output_path: Path to save the extracted clip
+        accurate: Re-encode so the clip starts exactly at start_time
+        use_gpu: Re-encode with hardware decoding and h264_nvenc
+        quality_mode: CPU encoder settings, see CLIP_QUALITY_ARGS
+        preview: Re-encode with fast low-latency preview settings
+        
+    Returns:
+        Path to the extracted clip
+    """
+    # Create output directory if it doesn't exist
+    _ensure_dir(os.path.dirname(output_path))
+    
+    # Optimize for social media (square format, shorter duration if needed)
+    # For Instagram Reels or TikTok, you might want to crop to 9:16
+    # Here we're keeping the original aspect ratio
+    
+    # One encoder thread per logical core; clips are also encoded in parallel by extract_clips
+    video_args = PREVIEW_ARGS if preview else _clip_quality_args(quality_mode)
+    reencode_args = [*video_args, '-threads', '0', '-c:a', 'aac']
+    
+    if use_gpu and _nvenc_available() and _video_codec(video_path) not in GPU_DECODE_UNSUPPORTED_CODECS:
+        # Decode, scale and encode all stay on the GPU
+        gpu_video_args = PREVIEW_GPU_ARGS if preview else ['-c:v', 'h264_nvenc', '-preset', 'p4']
+        try:
+            _run_clip_ffmpeg(
+                video_path, start_time, end_time, output_path,
+                [*gpu_video_args, '-c:a', 'aac'],
+                ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda']
+            )
+        except subprocess.CalledProcessError:
+            # e.g. out of NVENC sessions or an unsupported pixel format; use the CPU encoder
+            _run_clip_ffmpeg(video_path, start_time, end_time, output_path, reencode_args)
+    elif preview or accurate or use_gpu or not _can_stream_copy(video_path):
+        _run_clip_ffmpeg(video_path, start_time, end_time, output_path, reencode_args)
+    else:
+        try:
+            _run_clip_ffmpeg(
+                video_path, start_time, end_time, output_path,
+                [*_stream_copy_args(video_path), '-avoid_negative_ts', 'make_zero']
+            )
+        except subprocess.CalledProcessError:
+            # The streams couldn't be muxed as-is after all, so re-encode them
+            _run_clip_ffmpeg(video_path, start_time, end_time, output_path, reencode_args)
+    
+    return output_path
+
+def _extract_one(args: Tuple[str, float, float, str], **options: Any) -> str:
+    """Process pool entry point for extract_clips."""
+    video_path, start_time, end_time, output_path = args
+    return extract_clip(video_path, start_time, end_time, output_path, **options)
+
+@functools.lru_cache(maxsize=None)
+def _clip_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool extract_clips uses when no executor is passed.
+    
+    Created on first use and kept for the life of the process, so workers
+    only start once. They are spawned rather than forked, so this is safe
+    in a process that already runs other threads (e.g. the API server).
+    """
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+def extract_clips(
+    video_path: str,
+    ranges: List[Tuple[float, float, str]],
+    accurate: bool = False,
+    use_gpu: bool = False,
+    quality_mode: Literal['speed', 'balanced', 'quality'] = 'balanced',
+    preview: bool = False,
+    executor: Optional[Executor] = None
+) -> List[str]:
+    """
+    Extract several clips from a video in parallel worker processes.
+    
+    Each worker runs its own ffmpeg process with its own input handle.
+    
+    Args:
+        video_path: Path to the source video
+        ranges: (start_time, end_time, output_path) for each clip
+        accurate: Re-encode so the clips start exactly at their start times
+        use_gpu: Re-encode with hardware decoding and h264_nvenc
+        quality_mode: CPU encoder settings, see CLIP_QUALITY_ARGS
+        preview: Re-encode with fast low-latency preview settings
+        executor: Executor to run the clips on, defaults to a shared process pool
+        
+    Returns:
+        Paths to the extracted clips, in the same order as ranges
+    """
+    if not ranges:
+        return []
+    
+    jobs = [(video_path, start_time, end_time, output_path) for start_time, end_time, output_path in ranges]
+    extract_one = functools.partial(
+        _extract_one,
+        accurate=accurate, use_gpu=use_gpu, quality_mode=quality_mode, preview=preview
+    )
+    return list((executor or _clip_pool()).map(extract_one, jobs))
+
+def extract_thumbnail(video_path: str, time: float, output_path: str) -> str:
+    """
+    Extract a thumbnail from a video at the specified time.
+    
+    ffmpeg seeks to the nearest keyframe before the requested time and
+    writes the JPEG directly; move -ss after -i for a frame-accurate
+    (but slower) seek.
+    
+    Args:
+        video_path: Path to the source video
+        time: Time in seconds
+        output_path: Path to save the thumbnail
+        
+    Returns:
+        Path to the thumbnail
+    """
+    # Create output directory if it doesn't exist
+    _ensure_dir(os.path.dirname(output_path))
+    
+    _run_ffmpeg([
+        '-ss', str(time),
+        '-i', video_path,
+        '-frames:v', '1',
+        '-q:v', str(THUMBNAIL_QSCALE),
+        output_path
+    ])
+    
+    return output_path
+
+# Above this many timestamps the select expression gets unwieldy, so
+# thumbnails are extracted with one seeking input per timestamp instead
+MAX_SELECT_TERMS = 64
+
+@functools.lru_cache(maxsize=None)
+def _npp_scale_available() -> bool:
+    """Check once per process whether ffmpeg can decode with CUDA and resize with scale_npp."""
+    try:
+        filters = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-filters'],
+            capture_output=True, text=True, check=True
+        ).stdout
+        hwaccels = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-hwaccels'],
+            capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return 'scale_npp' in filters and 'cuda' in hwaccels.split()
+
+# 8-bit 4:2:0 sources, which NVDEC outputs as nv12; 10-bit ones come out as p010
+GPU_SCALE_PIX_FMTS = {'yuv420p', 'yuvj420p', 'nv12'}
+
+def _gpu_scalable(video_path: str) -> bool:
+    """Check whether a video can be decoded and resized on the GPU with an nv12 download."""
+    try:
+        stream = _video_stream(_ffprobe(video_path))
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return False
+    return (
+        stream.get('codec_name') not in GPU_DECODE_UNSUPPORTED_CODECS
+        and stream.get('pix_fmt') in GPU_SCALE_PIX_FMTS
+    )
+
+def _thumbnail_scale_args(
+    video_path: str,
+    width: Optional[int],
+    use_gpu: bool = True
+) -> Tuple[List[str], List[str]]:
+    """
+    Get the ffmpeg input arguments and filters for resizing thumbnails to a width.
+    
+    Resizing happens on the GPU right after NVDEC decoding when ffmpeg was built
+    with libnpp and the source is 8-bit 4:2:0 in a codec NVDEC supports, so only
+    the small output frames are copied back to the CPU.
+    """
+    if width is None:
+        return [], []
+    if use_gpu and _npp_scale_available() and _gpu_scalable(video_path):
+        return (
+            ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda'],
+            [f'scale_npp=w={width}:h=-1:interp_algo=lanczos', 'hwdownload', 'format=nv12', 'format=yuv420p']
+        )
+    return [], [f'scale={width}:-2']
+
+def _run_thumbnail_ffmpeg(
+    video_path: str,
+    width: Optional[int],
+    build_args: Callable[[List[str], List[str]], List[str]]
+) -> None:
+    """
+    Run a thumbnail ffmpeg command, resizing on the GPU when possible.
+    
+    Args:
+        video_path: Path to the source video
+        width: Width to resize thumbnails to, or None to keep the video size
+        build_args: Builds the ffmpeg arguments from the input arguments and
+            scale filters returned by _thumbnail_scale_args
+    """
+    input_args, scale_filters = _thumbnail_scale_args(video_path, width)
+    try:
+        _run_ffmpeg(build_args(input_args, scale_filters))
+    except subprocess.CalledProcessError:
+        if not input_args:
+            raise
+        # GPU decoding or scale_npp failed, so redo the frames on the CPU
+        _run_ffmpeg(build_args(*_thumbnail_scale_args(video_path, width, use_gpu=False)))
+
+def _extract_thumbnails_select(
+    video_path: str,
+    sorted_times: List[float],
+    output_dir: str,
+    width: Optional[int] = None
+) -> List[str]:
+    """
+    Extract one frame per timestamp with a single decoding pass and a select filter.
+    
+    Returns the extracted files in time order; the caller checks that one
+    file was produced per timestamp.
+    """
+    fps = _parse_rate(_video_stream(_ffprobe(video_path)).get('avg_frame_rate', '0/0'))
+    tolerance = 0.5 / fps if fps else 0.02
+    
+    # Select the frame within half a frame interval of each timestamp
+    expression = "+".join(f"lt(abs(t-{t})\\,{tolerance})" for t in sorted_times)
+    _run_thumbnail_ffmpeg(video_path, width, lambda input_args, scale_filters: [
+        *input_args,
+        '-i', video_path,
+        '-vf', ",".join([f"select='{expression}'", *scale_filters]),
+        # -vsync rather than -fps_mode, which needs ffmpeg 5.1 or newer
+        '-vsync', 'vfr',
+        '-q:v', str(THUMBNAIL_QSCALE),
+        os.path.join(output_dir, '%06d.jpg')
+    ])
+    
+    return [os.path.join(output_dir, name) for name in sorted(os.listdir(output_dir))]
+
+def _extract_thumbnails_seek(
+    video_path: str,
+    sorted_times: List[float],
+    output_dir: str,
+    width: Optional[int] = None
+) -> List[str]:
+    """Extract one frame per timestamp with a single ffmpeg process and one seeking input each."""
+    output_paths = [os.path.join(output_dir, f"{i + 1:06d}.jpg") for i in range(len(sorted_times))]
+    
+    def build_args(hwaccel_args: List[str], scale_filters: List[str]) -> List[str]:
+        filter_args = ['-vf', ",".join(scale_filters)] if scale_filters else []
+        input_args = []
+        output_args = []
+        for i, (t, output_path) in enumerate(zip(sorted_times, output_paths)):
+            input_args += [*hwaccel_args, '-ss', str(t), '-i', video_path]
+            output_args += [
+                '-map', f'{i}:v:0', *filter_args,
+                '-frames:v', '1', '-q:v', str(THUMBNAIL_QSCALE), output_path
+            ]
+        return [*input_args, *output_args]
+    
+    _run_thumbnail_ffmpeg(video_path, width, build_args)
+    
+    return output_paths
+
+def extract_thumbnails(
+    video_path: str,
+    times: List[float],
+    output_pattern: str,
+    width: Optional[int] = None
+) -> List[str]:
+    """
+    Extract thumbnails at several times with a single ffmpeg process.
+    
+    A select filter picks all requested frames in one decoding pass. If
+    there are too many timestamps for one expression, or the filter fails or
+    doesn't yield exactly one frame per timestamp, each timestamp gets its
+    own seeking input instead.
+    
+    With a width, thumbnails are resized keeping the aspect ratio, on the
+    GPU (scale_npp) when ffmpeg and the source support it, and on the CPU
+    otherwise or if the GPU run fails.
+    
+    Args:
+        video_path: Path to the source video
+        times: Times in seconds
+        output_pattern: printf-style output path taking the index of the
+            time in times, e.g. "thumbnails/video_%02d.jpg"
+        width: Width to resize thumbnails to, or None to keep the video size
+        
+    Returns:
+        Paths to the thumbnails, in the same order as times
+    """
+    if not times:
+        return []
+    
+    output_dir = os.path.dirname(output_pattern) or "."
+    
+    # Create output directory if it doesn't exist
+    _ensure_dir(output_dir)
+    
+    # Frames come out in time order, so remember where each time came from
+    order = sorted(range(len(times)), key=lambda i: times[i])
+    sorted_times = [times[i] for i in order]
+    
+    with tempfile.TemporaryDirectory(dir=output_dir) as temp_dir:
+        extracted = []
+        if len(times) <= MAX_SELECT_TERMS:
+            try:
+                extracted = _extract_thumbnails_select(video_path, sorted_times, temp_dir, width)
+            except subprocess.CalledProcessError:
+                extracted = []
+        
+        if len(extracted) != len(times):
+            for name in os.listdir(temp_dir):
+                os.remove(os.path.join(temp_dir, name))
+            extracted = _extract_thumbnails_seek(video_path, sorted_times, temp_dir, width)
+        
+        output_paths = [None] * len(times)
+        for index, path in zip(order, extracted):
+            output_paths[index] = output_pattern % index
+            os.replace(path, output_paths[index])
+    
+    return output_paths
 
 class VideoProcessor:
     def __init__(self, video_path: str):
@@ -10,19 +665,182 @@ class VideoProcessor:
             raise FileNotFoundError(f"Video file not found: {video_path}")
         
         self.video_path = video_path
-        self.video_clip = VideoFileClip(video_path)
+        self._probe_result: Optional[Dict[str, Any]] = None
+        self._gpu_decoder = None
+        self._container = None
+    
+    def _open_container(self) -> Any:
+        """Get the shared PyAV container, opening the file on first use."""
+        if self._container is None:
+            self._container = av.open(self.video_path)
+        return self._container
+    
+    def _iter_frames(self, start_time: float, end_time: Optional[float] = None) -> Iterator[Any]:
+        """
+        Decode video frames between start_time and end_time with the shared container.
+        
+        Seeks to the keyframe before start_time, so only the frames from
+        there on are decoded. Not safe to use from several threads at once.
+        
+        Args:
+            start_time: Start time in seconds
+            end_time: End time in seconds, or None to decode until the end
+            
+        Returns:
+            Iterator of av.VideoFrame
+        """
+        container = self._open_container()
+        container.seek(int(start_time * av.time_base), backward=True, any_frame=False)
+        
+        for frame in container.decode(video=0):
+            if frame.time is None or frame.time < start_time:
+                continue
+            if end_time is not None and frame.time > end_time:
+                break
+            yield frame
+    
+    def close(self):
+        """Close the shared container and release the GPU decoder if they were opened."""
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+        self._gpu_decoder = None
+    
+    def __enter__(self) -> "VideoProcessor":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+    
+    def _probe(self) -> Dict[str, Any]:
+        """Get the video's ffprobe metadata, probing the file on first use."""
+        if self._probe_result is None:
+            self._probe_result = _ffprobe(self.video_path)
+        return self._probe_result
+    
+    @functools.cached_property
+    def duration(self) -> float:
+        """Duration of the video in seconds."""
+        return float(self._probe()['format']['duration'])
+    
+    @functools.cached_property
+    def frame_count(self) -> int:
+        """
+        Total number of frames in the video.
+        
+        Uses the frame count stored in the container when present. Otherwise
+        the video packets are counted with ffprobe (no decoding), and only as
+        a last resort the count is estimated from frame rate and duration.
+        """
+        stream = _video_stream(self._probe())
+        
+        nb_frames = stream.get('nb_frames')
+        if nb_frames and nb_frames.isdigit():
+            return int(nb_frames)
+        
+        result = subprocess.run(
+            [
+                'ffprobe', '-v', 'error',
+                '-select_streams', 'v:0',
+                '-count_packets',
+                '-show_entries', 'stream=nb_read_packets',
+                '-of', 'default=noprint_wrappers=1:nokey=1',
+                self.video_path
+            ],
+            capture_output=True, text=True
+        )
+        nb_read_packets = result.stdout.strip()
+        if result.returncode == 0 and nb_read_packets.isdigit():
+            return int(nb_read_packets)
+        
+        fps = _parse_rate(stream.get('r_frame_rate', '0/0'))
+        return int(fps * self.duration)
     
     def get_duration(self) -> float:
         """Get the duration of the video in seconds."""
-        return self.video_clip.duration
+        return self.duration
     
     def get_frame_count(self) -> int:
         """Get the total number of frames in the video."""
-        fps = self.video_clip.fps
-        duration = self.video_clip.duration
-        return int(fps * duration)
+        return self.frame_count
     
-    def extract_clip(self, start_time: float, end_time: float, output_path: str) -> str:
+    async def sample_frames(self, count: int) -> Tuple[List[bytes], float]:
+        """
+        Sample evenly spaced frames from the video as JPEG images.
+        
+        Args:
+            count: Number of frames to sample
+            
+        Returns:
+            Tuple of (JPEG images as raw bytes, video duration in seconds)
+        """
+        duration = self.duration
+        times = [duration * i / (count + 1) for i in range(1, count + 1)]
+        frames = await _sample_frames_ffmpeg(self.video_path, times)
+        return frames, duration
+    
+    def extract_frame_gpu(self, time: float) -> Any:
+        """
+        Decode a single frame on the GPU (NVDEC) and return it as a CUDA tensor.
+        
+        Uses torchcodec, or decord if torchcodec can't be loaded. The decoder is
+        created on first use and kept on the instance, so the demuxer and CUDA
+        context are only initialized once per video.
+        
+        Args:
+            time: Time in seconds
+            
+        Returns:
+            uint8 torch.Tensor of shape (3, height, width) on the GPU
+        """
+        VideoDecoder = _load_torchcodec_decoder()
+        if VideoDecoder is not None:
+            if self._gpu_decoder is None:
+                self._gpu_decoder = VideoDecoder(self.video_path, device='cuda')
+            return self._gpu_decoder.get_frame_played_at(time).data
+        
+        decord = _load_decord()
+        if decord is not None:
+            if self._gpu_decoder is None:
+                decord.bridge.set_bridge('torch')
+                self._gpu_decoder = decord.VideoReader(self.video_path, ctx=decord.gpu(0))
+            index = min(int(time * self._gpu_decoder.get_avg_fps()), len(self._gpu_decoder) - 1)
+            return self._gpu_decoder[index].permute(2, 0, 1)
+        
+        raise RuntimeError("GPU frame decoding requires torchcodec or decord to be installed and loadable")
+    
+    def get_frame_fast(self, time: float) -> Any:
+        """
+        Decode a single frame in-process with PyAV and return its RGB pixels.
+        
+        Uses the shared container, so there's no ffmpeg process or pipe per
+        frame, and only the frames from the keyframe before time are decoded.
+        
+        Args:
+            time: Time in seconds
+            
+        Returns:
+            uint8 numpy array of shape (height, width, 3)
+        """
+        if av is None:
+            raise RuntimeError("In-process frame decoding requires PyAV to be installed")
+        
+        frame = next(self._iter_frames(time), None)
+        if frame is None:
+            raise ValueError(f"No frame at {time} seconds in {self.video_path}")
+        
+        return frame.to_ndarray(format='rgb24')
+    
+    def extract_clip(
+        self,
+        start_time: float,
+        end_time: float,
+        output_path: str,
+        accurate: bool = False,
+        use_gpu: bool = False,
+        quality_mode: Literal['speed', 'balanced', 'quality'] = 'balanced',
+        preview: bool = False
+    ) -> str:
         """
         Extract a clip from the video between start_time and end_time.
         
@@ -30,36 +848,54 @@ class VideoProcessor:
             start_time: Start time in seconds
             end_time: End time in seconds
             output_path: Path to save the extracted clip
+            accurate: Re-encode so the clip starts exactly at start_time
+            use_gpu: Re-encode with hardware decoding and h264_nvenc
+            quality_mode: CPU encoder settings, see CLIP_QUALITY_ARGS
+            preview: Re-encode with fast low-latency preview settings
             
         Returns:
             Path to the extracted clip
         """
-        # Create output directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Extract the subclip
-        subclip = self.video_clip.subclip(start_time, end_time)
-        
-        # Optimize for social media (square format, shorter duration if needed)
-        # For Instagram Reels or TikTok, you might want to crop to 9:16
-        # Here we're keeping the original aspect ratio
-        
-        # Save the clip
-        subclip.write_videofile(
-            output_path,
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
-            remove_temp=True,
-            preset='ultrafast'  # Use 'medium' or 'slow' for better quality in production
+        return extract_clip(
+            self.video_path, start_time, end_time, output_path,
+            accurate, use_gpu, quality_mode, preview
         )
+    
+    def extract_clips(
+        self,
+        ranges: List[Tuple[float, float, str]],
+        accurate: bool = False,
+        use_gpu: bool = False,
+        quality_mode: Literal['speed', 'balanced', 'quality'] = 'balanced',
+        preview: bool = False,
+        executor: Optional[Executor] = None
+    ) -> List[str]:
+        """
+        Extract several clips from the video in parallel.
         
-        return output_path
+        Args:
+            ranges: (start_time, end_time, output_path) for each clip
+            accurate: Re-encode so the clips start exactly at their start times
+            use_gpu: Re-encode with hardware decoding and h264_nvenc
+            quality_mode: CPU encoder settings, see CLIP_QUALITY_ARGS
+            preview: Re-encode with fast low-latency preview settings
+            executor: Executor to run the clips on, defaults to a shared process pool
+            
+        Returns:
+            Paths to the extracted clips, in the same order as ranges
+        """
+        return extract_clips(
+            self.video_path, ranges,
+            accurate, use_gpu, quality_mode, preview, executor
+        )
     
     def extract_thumbnail(self, time: float, output_path: str) -> str:
         """
         Extract a thumbnail from the video at the specified time.
         
+        Decodes with the shared PyAV container when PyAV is installed and
+        with an ffmpeg process otherwise; both write JPEGs at THUMBNAIL_QSCALE.
+        
         Args:
             time: Time in seconds
             output_path: Path to save the thumbnail
@@ -67,53 +903,104 @@ class VideoProcessor:
         Returns:
             Path to the thumbnail
         """
-        # Create output directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Extract the frame
-        frame = self.video_clip.get_frame(time)
+        if av is None:
+            return extract_thumbnail(self.video_path, time, output_path)
         
-        # Save the frame as an image
-        from PIL import Image
-        import numpy as np
+        # Reuse the open container instead of starting a new ffmpeg process
+        frame = next(self._iter_frames(time), None)
+        if frame is None:
+            raise ValueError(f"No frame at {time} seconds in {self.video_path}")
         
-        img = Image.fromarray(np.uint8(frame))
-        img.save(output_path)
+        _ensure_dir(os.path.dirname(output_path))
+        _write_jpeg(frame, output_path)
         
         return output_path
     
-    def __del__(self):
-        """Close the video clip when the processor is deleted."""
-        if hasattr(self, 'video_clip') and self.video_clip is not None:
-            self.video_clip.close()
-
-    def add_subtitles(self, subtitle_path: str, output_path: Optional[str] = None) -> str:
+    def extract_thumbnails(
+        self,
+        times: List[float],
+        output_pattern: str,
+        width: Optional[int] = None
+    ) -> List[str]:
+        """
+        Extract thumbnails from the video at several times.
+        
+        Args:
+            times: Times in seconds
+            output_pattern: printf-style output path taking the index of the time in times
+            width: Width to resize thumbnails to, or None to keep the video size
+            
+        Returns:
+            Paths to the thumbnails, in the same order as times
+        """
+        return extract_thumbnails(self.video_path, times, output_pattern, width)
+    
+    def add_subtitles(
+        self,
+        subtitle_path: str,
+        output_path: Optional[str] = None,
+        burn_in: bool = False
+    ) -> str:
         """
         Add subtitles to the video.
         
+        By default the subtitles are muxed as a soft mov_text track into an MP4
+        (or MOV) file, copying the audio and video streams when their codecs
+        fit the container and re-encoding them otherwise. Pass burn_in=True to
+        render them into the picture instead, which requires re-encoding the
+        video (on the GPU with h264_nvenc when it works on this host). Output
+        paths in other containers, which can't hold mov_text, are burned in.
+        
         Args:
             subtitle_path: Path to the subtitle file (.srt or .vtt)
-            output_path: Path to save the video with subtitles
+            output_path: Path to save the video with subtitles; defaults to an
+                MP4 next to the source (or the source's format when burning in)
+            burn_in: Render the subtitles into the video frames
             
         Returns:
             Path to the video with subtitles
         """
         if output_path is None:
             base, ext = os.path.splitext(self.video_path)
-            output_path = f"{base}_subtitled{ext}"
+            output_path = f"{base}_subtitled{ext if burn_in else '.mp4'}"
+        elif os.path.splitext(output_path)[1].lower() not in SOFT_SUBTITLE_EXTENSIONS:
+            burn_in = True
         
         # Create output directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Use ffmpeg to add subtitles
-        command = [
-            'ffmpeg',
-            '-i', self.video_path,
-            '-vf', f'subtitles={subtitle_path}',
-            '-c:a', 'copy',
-            output_path
-        ]
+        _ensure_dir(os.path.dirname(output_path))
         
-        subprocess.run(command, check=True)
+        if burn_in:
+            def burn_in_args(video_codec: str) -> List[str]:
+                return [
+                    '-i', self.video_path,
+                    '-vf', f'subtitles={subtitle_path}',
+                    '-c:v', video_codec,
+                    '-threads', '0',
+                    '-c:a', 'copy',
+                    output_path
+                ]
+            
+            if _nvenc_available():
+                try:
+                    _run_ffmpeg(burn_in_args('h264_nvenc'))
+                    return output_path
+                except subprocess.CalledProcessError:
+                    # Fall back to the CPU encoder below
+                    pass
+            _run_ffmpeg(burn_in_args('libx264'))
+        else:
+            if _can_stream_copy(self.video_path):
+                codec_args = _stream_copy_args(self.video_path)
+            else:
+                codec_args = [*CLIP_QUALITY_ARGS['balanced'], '-threads', '0', '-c:a', 'aac']
+            _run_ffmpeg([
+                '-i', self.video_path,
+                '-i', subtitle_path,
+                '-map', '0:v', '-map', '0:a?', '-map', '1:0',
+                *codec_args,
+                '-c:s', 'mov_text',
+                '-metadata:s:s:0', 'language=eng',
+                output_path
+            ])
         
-        return output_path
\ No newline at end of file
+        return output_path